@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request, Response, UploadFile, File
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 import json
+import msgspec
 from pydantic import BaseModel
 
 from app.services.ai_service import AIService
 from app.services.canvas_service import CanvasService
 from app.models.drawing import DrawingData, ShapeDetectionRequest, OCRRequest
+from app.models.drawing_codec import drawing_data_decoder
+from app.utils.batching import DynamicBatcher
 
 # Request models
 class CreateRoomRequest(BaseModel):
@@ -19,6 +22,29 @@ api_router = APIRouter()
 ai_service = AIService()
 canvas_service = CanvasService()
 
+# Batch handlers: process coalesced requests back-to-back on one worker so
+# the Tesseract/OpenCV engine state stays hot across concurrent calls
+async def _run_shape_detection_batch(requests: List[ShapeDetectionRequest]) -> List:
+    results = []
+    for request in requests:
+        try:
+            results.append(await ai_service.detect_shapes(request.image_data, request.confidence_threshold))
+        except Exception as e:
+            results.append(e)
+    return results
+
+async def _run_ocr_batch(requests: List[OCRRequest]) -> List:
+    results = []
+    for request in requests:
+        try:
+            results.append(await ai_service.perform_ocr(request.image_data, request.language))
+        except Exception as e:
+            results.append(e)
+    return results
+
+shape_detection_batcher = DynamicBatcher(_run_shape_detection_batch, max_batch_size=8, max_delay=0.05)
+ocr_batcher = DynamicBatcher(_run_ocr_batch, max_batch_size=8, max_delay=0.05)
+
 @api_router.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -46,7 +72,7 @@ async def get_room_info(room_id: str):
 async def detect_shapes(request: ShapeDetectionRequest):
     """Detect and clean shapes in drawing data"""
     try:
-        result = await ai_service.detect_shapes(request.image_data)
+        result = await shape_detection_batcher.submit(request)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Shape detection failed: {str(e)}")
@@ -55,7 +81,27 @@ async def detect_shapes(request: ShapeDetectionRequest):
 async def perform_ocr(request: OCRRequest):
     """Perform OCR on drawing data"""
     try:
-        result = await ai_service.perform_ocr(request.image_data)
+        result = await ocr_batcher.submit(request)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR failed: {str(e)}")
+
+@api_router.post("/ai/detect-shapes-binary")
+async def detect_shapes_binary(file: UploadFile = File(...), confidence_threshold: float = 0.7):
+    """Detect shapes in a raw image upload (no base64 on the wire)"""
+    try:
+        image_bytes = await file.read()
+        result = await ai_service.detect_shapes_bytes(image_bytes, confidence_threshold)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Shape detection failed: {str(e)}")
+
+@api_router.post("/ai/ocr-binary")
+async def perform_ocr_binary(file: UploadFile = File(...), language: str = "eng"):
+    """Perform OCR on a raw image upload (no base64 on the wire)"""
+    try:
+        image_bytes = await file.read()
+        result = await ai_service.perform_ocr_bytes(image_bytes, language)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR failed: {str(e)}")
@@ -70,40 +116,59 @@ async def analyze_canvas(room_id: str):
         raise HTTPException(status_code=500, detail=f"Canvas analysis failed: {str(e)}")
 
 @api_router.post("/canvas/save")
-async def save_canvas(room_id: str, drawing_data: DrawingData):
+async def save_canvas(room_id: str, request: Request):
     """Save canvas state"""
     try:
-        canvas_service.save_canvas(room_id, drawing_data)
+        # Decode the body straight into msgspec structs, bypassing
+        # Pydantic's per-stroke/per-point model allocations
+        drawing_data = drawing_data_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid drawing data: {str(e)}")
+
+    try:
+        await canvas_service.save_canvas(room_id, drawing_data)
         return {"message": "Canvas saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save canvas: {str(e)}")
 
 @api_router.get("/canvas/{room_id}")
-async def get_canvas(room_id: str):
+async def get_canvas(room_id: str, request: Request):
     """Get canvas state"""
     try:
-        canvas_data = canvas_service.get_canvas(room_id)
-        return canvas_data
-    except Exception as e:
+        snapshot, etag = canvas_service.get_canvas_snapshot(room_id)
+    except Exception:
         raise HTTPException(status_code=404, detail="Canvas not found")
 
+    # Serve the pre-serialized snapshot; 304 if the client already has it
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+
+    return Response(content=snapshot, media_type="application/json", headers={'ETag': etag})
+
 @api_router.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
     """Upload an image to the whiteboard"""
     try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
         image_url = await canvas_service.upload_image(file)
         return {"image_url": image_url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @api_router.get("/analytics/{room_id}")
-async def get_room_analytics(room_id: str):
+async def get_room_analytics(room_id: str, request: Request):
     """Get room analytics and insights"""
     try:
-        analytics = canvas_service.get_room_analytics(room_id)
-        return analytics
+        cached = canvas_service.get_analytics_snapshot(room_id)
+        if cached is None:
+            # No analytics recorded yet; fall back to the mock payload
+            return canvas_service.get_room_analytics(room_id)
+
+        snapshot, etag = cached
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers={'ETag': etag})
+
+        return Response(content=snapshot, media_type="application/json", headers={'ETag': etag})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}") 
\ No newline at end of file
@@ -8,6 +8,11 @@ class Settings(BaseSettings):
     # API Configuration
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Smart Whiteboard API"
+
+    # Server Configuration
+    # >1 worker needs sticky sessions and a Socket.IO message queue in
+    # front, since rooms and snapshot caches are per-process
+    WORKERS: int = 1
     
     # CORS Configuration
     CORS_ORIGINS: List[str] = [
@@ -21,6 +26,7 @@ class Settings(BaseSettings):
     
     # Database Configuration
     DATABASE_URL: str = "sqlite:///./whiteboard.db"
+    CANVAS_DB_PATH: str = "whiteboard.db"
     
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+
+class KeyValueStore:
+    """Small SQLite-backed key-value store in WAL mode
+
+    Stores pre-serialized JSON bytes keyed by room_id, one table per
+    namespace. WAL journaling keeps readers unblocked during writes, data
+    survives restarts, and the OS page cache bounds the hot set instead of
+    process-local dicts growing without limit.
+    """
+
+    def __init__(self, path: str, tables: Iterable[str]):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # sqlite3 connections are serialized per-statement, but our
+        # read-modify-write sequences need a coarser lock
+        self._lock = threading.Lock()
+
+        for table in tables:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+            )
+        self._conn.commit()
+
+    def get(self, table: str, key: str) -> Optional[bytes]:
+        """Get the stored bytes for a key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {table} WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, table: str, key: str, value: bytes) -> None:
+        """Insert or replace the bytes for a key"""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {table} (key, value) VALUES (?, ?)",
+                (key, value)
+            )
+            self._conn.commit()
+
+    def delete(self, table: str, key: str) -> None:
+        """Delete a key if present"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def exists(self, table: str, key: str) -> bool:
+        """Check whether a key is present"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT 1 FROM {table} WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def keys(self, table: str) -> List[str]:
+        """List all keys in a table"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key FROM {table}").fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """Close the underlying connection"""
+        with self._lock:
+            self._conn.close()
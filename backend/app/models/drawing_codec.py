@@ -0,0 +1,35 @@
+import msgspec
+from typing import List, Optional
+
+from app.models.drawing import ToolType, ShapeType
+
+# msgspec mirrors of the drawing models for the hot /canvas/save path.
+# A canvas can carry thousands of points; msgspec decodes JSON straight
+# into these structs several times faster than Pydantic validation and
+# without a Python object per primitive field. The small request models
+# (rooms, OCR, shape detection) stay on Pydantic, where the cost is
+# irrelevant.
+
+class DrawingPoint(msgspec.Struct, frozen=True):
+    x: float
+    y: float
+    pressure: Optional[float] = 1.0
+
+class DrawingStroke(msgspec.Struct):
+    points: List[DrawingPoint]
+    color: str = "#000000"
+    width: float = 2.0
+    tool: ToolType = ToolType.PEN
+    shape_type: Optional[ShapeType] = None
+
+class DrawingData(msgspec.Struct):
+    strokes: List[DrawingStroke] = msgspec.field(default_factory=list)
+    canvas_width: int = 1920
+    canvas_height: int = 1080
+    background_color: str = "#ffffff"
+    timestamp: Optional[str] = None
+
+# Reusable codec instances (building a Decoder per call would redo the
+# schema analysis)
+drawing_data_decoder = msgspec.json.Decoder(DrawingData)
+drawing_data_encoder = msgspec.json.Encoder()
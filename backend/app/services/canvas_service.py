@@ -1,27 +1,64 @@
-import uuid
+import asyncio
 import json
+import hashlib
 import os
+from secrets import token_urlsafe
 import aiofiles
-from typing import Dict, Any, Optional
+import orjson
+from collections import Counter, defaultdict
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
 
 from app.models.drawing import DrawingData, CanvasAnalytics
+from app.models import drawing_codec
 from app.core.config import settings
+from app.core.storage import KeyValueStore
+
+# Chunk size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading magic bytes of the image formats we accept
+IMAGE_MAGIC_BYTES = (
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'\xff\xd8\xff',       # JPEG
+    b'GIF87a',             # GIF
+    b'GIF89a',
+    b'RIFF',               # WebP (RIFF container)
+    b'BM',                 # BMP
+)
 
 class CanvasService:
     """Service for managing canvas state and rooms"""
-    
+
     def __init__(self):
-        self.rooms: Dict[str, Dict[str, Any]] = {}
-        self.canvas_data: Dict[str, DrawingData] = {}
-        self.analytics: Dict[str, CanvasAnalytics] = {}
-    
+        # Rooms, canvases, and analytics live in SQLite (WAL mode) as
+        # orjson bytes keyed by room_id, so state survives restarts and
+        # RSS stays bounded instead of growing with every room
+        self._store = KeyValueStore(settings.CANVAS_DB_PATH,
+                                    ("rooms", "canvases", "analytics"))
+        # Pre-serialized JSON snapshots (+ ETags) served by the GET routes,
+        # refreshed on save so reads skip Pydantic serialization entirely
+        self.canvas_snapshot: Dict[str, bytes] = {}
+        self.canvas_etag: Dict[str, str] = {}
+        self.analytics_snapshot: Dict[str, bytes] = {}
+        self.analytics_etag: Dict[str, str] = {}
+        # One lock per room: concurrent saves to the same room serialize
+        # (the analytics update is a read-modify-write), while saves to
+        # different rooms proceed in parallel
+        self._room_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def close(self) -> None:
+        """Close the backing store"""
+        self._store.close()
+
     def create_room(self, room_name: str) -> str:
         """Create a new whiteboard room"""
-        room_id = str(uuid.uuid4())
-        
-        self.rooms[room_id] = {
+        # Shorter than a UUID4 string (less hashing per key lookup) while
+        # still cryptographically random
+        room_id = token_urlsafe(12)
+
+        room = {
             'id': room_id,
             'name': room_name,
             'created_at': datetime.now().isoformat(),
@@ -29,64 +66,123 @@ class CanvasService:
             'canvas_width': settings.DEFAULT_CANVAS_WIDTH,
             'canvas_height': settings.DEFAULT_CANVAS_HEIGHT
         }
-        
+        self._store.put("rooms", room_id, orjson.dumps(room))
+
         # Initialize empty canvas
-        self.canvas_data[room_id] = DrawingData(
+        canvas = DrawingData(
             canvas_width=settings.DEFAULT_CANVAS_WIDTH,
             canvas_height=settings.DEFAULT_CANVAS_HEIGHT
         )
-        
+        self._store.put("canvases", room_id, orjson.dumps(canvas.model_dump()))
+
         return room_id
-    
+
     def get_room_info(self, room_id: str) -> Dict[str, Any]:
         """Get room information"""
-        if room_id not in self.rooms:
+        room = self._store.get("rooms", room_id)
+        if room is None:
             raise Exception("Room not found")
-        
-        return self.rooms[room_id]
-    
-    def save_canvas(self, room_id: str, drawing_data: DrawingData) -> None:
-        """Save canvas state"""
-        if room_id not in self.rooms:
+
+        return orjson.loads(room)
+
+    async def save_canvas(self, room_id: str, drawing_data: drawing_codec.DrawingData) -> None:
+        """Save canvas state (drawing_data is a msgspec struct)"""
+        if not self._store.exists("rooms", room_id):
             raise Exception("Room not found")
-        
-        self.canvas_data[room_id] = drawing_data
-        
-        # Update room analytics
-        self._update_room_analytics(room_id, drawing_data)
-    
+
+        async with self._room_locks[room_id]:
+            # Serialize once; the same bytes back the store, the GET
+            # snapshot, and the ETag
+            canvas_bytes = drawing_codec.drawing_data_encoder.encode(drawing_data)
+            self._store.put("canvases", room_id, canvas_bytes)
+
+            # Update room analytics
+            analytics_bytes = self._update_room_analytics(room_id, drawing_data)
+
+            self._cache_snapshot(room_id, canvas_bytes, analytics_bytes)
+
     def get_canvas(self, room_id: str) -> DrawingData:
         """Get canvas state"""
-        if room_id not in self.canvas_data:
+        canvas = self._store.get("canvases", room_id)
+        if canvas is None:
             raise Exception("Canvas not found")
-        
-        return self.canvas_data[room_id]
-    
+
+        return DrawingData(**orjson.loads(canvas))
+
+    def get_canvas_snapshot(self, room_id: str) -> Tuple[bytes, str]:
+        """Get the pre-serialized canvas JSON and its ETag"""
+        if room_id not in self.canvas_snapshot:
+            canvas = self._store.get("canvases", room_id)
+            if canvas is None:
+                raise Exception("Canvas not found")
+            self._cache_snapshot(room_id, canvas, self._store.get("analytics", room_id))
+
+        return self.canvas_snapshot[room_id], self.canvas_etag[room_id]
+
+    def get_analytics_snapshot(self, room_id: str) -> Optional[Tuple[bytes, str]]:
+        """Get the pre-serialized analytics JSON and its ETag, if available"""
+        if room_id not in self.analytics_snapshot:
+            analytics = self._store.get("analytics", room_id)
+            if analytics is None:
+                return None
+            self._cache_snapshot(room_id, None, analytics)
+
+        return self.analytics_snapshot[room_id], self.analytics_etag[room_id]
+
+    def _cache_snapshot(self, room_id: str, canvas_bytes: Optional[bytes],
+                        analytics_bytes: Optional[bytes]) -> None:
+        """Cache serialized JSON (+ ETags) for the GET routes"""
+        if canvas_bytes is not None:
+            self.canvas_snapshot[room_id] = canvas_bytes
+            self.canvas_etag[room_id] = hashlib.blake2b(canvas_bytes, digest_size=8).hexdigest()
+
+        if analytics_bytes is not None:
+            self.analytics_snapshot[room_id] = analytics_bytes
+            self.analytics_etag[room_id] = hashlib.blake2b(analytics_bytes, digest_size=8).hexdigest()
+
     async def upload_image(self, file: UploadFile) -> str:
-        """Upload an image to the whiteboard"""
+        """Upload an image to the whiteboard, streaming it to disk in chunks"""
+        # Create upload directory if it doesn't exist
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+
+        # Generate unique filename
+        file_extension = os.path.splitext(file.filename or "")[1]
+        filename = f"{token_urlsafe(16)}{file_extension}"
+        file_path = os.path.join(settings.UPLOAD_DIR, filename)
+
+        # Stream the upload chunk by chunk so memory stays bounded
+        # regardless of file size
+        bytes_written = 0
         try:
-            # Create upload directory if it doesn't exist
-            os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-            
-            # Generate unique filename
-            file_extension = os.path.splitext(file.filename or "")[1]
-            filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(settings.UPLOAD_DIR, filename)
-            
-            # Save file
             async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-            
-            # Return file URL
-            return f"/uploads/{filename}"
-            
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    if bytes_written == 0 and not chunk.startswith(IMAGE_MAGIC_BYTES):
+                        # Check the actual file contents, not the
+                        # client-supplied content type
+                        raise HTTPException(status_code=400, detail="File must be an image")
+
+                    bytes_written += len(chunk)
+                    if bytes_written > settings.MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail="File too large")
+
+                    await f.write(chunk)
+        except HTTPException:
+            # Remove the partial file before reporting the error
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
         except Exception as e:
+            if os.path.exists(file_path):
+                os.remove(file_path)
             raise Exception(f"Failed to upload image: {str(e)}")
-    
+
+        # Return file URL
+        return f"/uploads/{filename}"
+
     def get_room_analytics(self, room_id: str) -> CanvasAnalytics:
         """Get room analytics"""
-        if room_id not in self.analytics:
+        analytics = self._store.get("analytics", room_id)
+        if analytics is None:
             # Return mock analytics if not available
             return CanvasAnalytics(
                 total_strokes=0,
@@ -96,13 +192,14 @@ class CanvasService:
                 shape_count={},
                 color_usage={}
             )
-        
-        return self.analytics[room_id]
-    
-    def _update_room_analytics(self, room_id: str, drawing_data: DrawingData) -> None:
-        """Update room analytics based on drawing data"""
-        if room_id not in self.analytics:
-            self.analytics[room_id] = CanvasAnalytics(
+
+        return CanvasAnalytics(**orjson.loads(analytics))
+
+    def _update_room_analytics(self, room_id: str, drawing_data: drawing_codec.DrawingData) -> bytes:
+        """Update room analytics based on drawing data, returning the bytes"""
+        stored = self._store.get("analytics", room_id)
+        if stored is None:
+            analytics = CanvasAnalytics(
                 total_strokes=0,
                 active_users=1,
                 drawing_time=0.0,
@@ -110,53 +207,53 @@ class CanvasService:
                 shape_count={},
                 color_usage={}
             )
-        
-        analytics = self.analytics[room_id]
-        
-        # Update stroke count
-        analytics.total_strokes = len(drawing_data.strokes)
-        
-        # Update color usage
-        color_usage = {}
-        for stroke in drawing_data.strokes:
-            color = stroke.color
-            color_usage[color] = color_usage.get(color, 0) + 1
-        
-        analytics.color_usage = color_usage
-        
-        # Update shape count
-        shape_count = {}
-        for stroke in drawing_data.strokes:
-            if stroke.shape_type:
-                shape_name = stroke.shape_type.value
-                shape_count[shape_name] = shape_count.get(shape_name, 0) + 1
-        
-        analytics.shape_count = shape_count
-        
+        else:
+            analytics = CanvasAnalytics(**orjson.loads(stored))
+
+        # Pull the stroke attributes once, then let Counter (C-implemented)
+        # do the counting instead of per-stroke dict updates in Python
+        colors = [stroke.color for stroke in drawing_data.strokes]
+        shapes = [stroke.shape_type.value for stroke in drawing_data.strokes if stroke.shape_type]
+
+        analytics.total_strokes = len(colors)
+        analytics.color_usage = dict(Counter(colors))
+        analytics.shape_count = dict(Counter(shapes))
+
         # Update drawing time (mock calculation)
-        analytics.drawing_time = len(drawing_data.strokes) * 0.1  # 0.1 seconds per stroke
-        
-        self.analytics[room_id] = analytics
-    
+        analytics.drawing_time = len(colors) * 0.1  # 0.1 seconds per stroke
+
+        analytics_bytes = orjson.dumps(analytics.model_dump())
+        self._store.put("analytics", room_id, analytics_bytes)
+        return analytics_bytes
+
     def join_room(self, room_id: str, user_id: str) -> None:
         """User joins a room"""
-        if room_id not in self.rooms:
+        room = self._store.get("rooms", room_id)
+        if room is None:
             raise Exception("Room not found")
-        
-        self.rooms[room_id]['active_users'] += 1
-    
+
+        room = orjson.loads(room)
+        room['active_users'] += 1
+        self._store.put("rooms", room_id, orjson.dumps(room))
+
     def leave_room(self, room_id: str, user_id: str) -> None:
         """User leaves a room"""
-        if room_id in self.rooms:
-            self.rooms[room_id]['active_users'] = max(0, self.rooms[room_id]['active_users'] - 1)
-    
+        room = self._store.get("rooms", room_id)
+        if room is None:
+            return
+
+        room = orjson.loads(room)
+        room['active_users'] = max(0, room['active_users'] - 1)
+        self._store.put("rooms", room_id, orjson.dumps(room))
+
     def delete_room(self, room_id: str) -> None:
         """Delete a room and its data"""
-        if room_id in self.rooms:
-            del self.rooms[room_id]
-        
-        if room_id in self.canvas_data:
-            del self.canvas_data[room_id]
-        
-        if room_id in self.analytics:
-            del self.analytics[room_id] 
\ No newline at end of file
+        self._store.delete("rooms", room_id)
+        self._store.delete("canvases", room_id)
+        self._store.delete("analytics", room_id)
+
+        for cache in (self.canvas_snapshot, self.canvas_etag,
+                      self.analytics_snapshot, self.analytics_etag):
+            cache.pop(room_id, None)
+
+        self._room_locks.pop(room_id, None)
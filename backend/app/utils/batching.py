@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+class DynamicBatcher:
+    """Coalesce concurrent requests into batches handled by one worker
+
+    Requests submitted within a short window are collected (up to
+    max_batch_size) and processed back-to-back, so expensive engine state
+    (Tesseract API, OpenCV buffers) stays hot instead of being paid per call.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_delay: float = 0.05
+    ):
+        self._handler = handler
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._queue: "asyncio.Queue[Tuple[Any, asyncio.Future]]" = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Submit one item and wait for its result"""
+        if self._worker is None:
+            # Start lazily so the batcher can be created at import time,
+            # before the event loop exists
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the worker task"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _collect_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Wait for one item, then gather more until the delay window closes"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_delay
+
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+
+            try:
+                results = await self._handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Handlers may return an exception per item so one bad request
+            # doesn't fail the whole batch
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
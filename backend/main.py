@@ -1,23 +1,57 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import socketio
 from app.core.config import settings
-from app.api.routes import api_router
+from app.api.routes import api_router, ai_service, canvas_service, shape_detection_batcher, ocr_batcher
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manage application startup and shutdown"""
+    yield
+    # Stop the batch workers, release the Tesseract API instances, and
+    # close the canvas store
+    await shape_detection_batcher.close()
+    await ocr_batcher.close()
+    ai_service.close()
+    canvas_service.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="Smart Whiteboard API",
     description="AI-powered collaborative whiteboard backend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson serializes large nested payloads (heatmaps, stroke lists)
+    # far faster than the stdlib json encoder
+    default_response_class=ORJSONResponse
 )
 
-# Configure CORS
+class FrozenOriginCORSMiddleware(CORSMiddleware):
+    """CORSMiddleware with O(1) origin membership checks
+
+    Starlette scans the allowed-origins list linearly on every request and
+    WebSocket upgrade; with sustained Socket.IO traffic a frozenset lookup
+    is the cheaper check.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._origins_set = frozenset(kwargs.get('allow_origins', ()))
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        return origin in self._origins_set
+
+# Configure CORS with explicit method/header lists so Starlette can
+# precompute them once instead of handling wildcards per request
 app.add_middleware(
-    CORSMiddleware,
+    FrozenOriginCORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match"],
 )
 
 # Include API routes
@@ -74,7 +108,11 @@ async def draw_data(sid, data):
     if room:
         # Process drawing data with AI if needed
         processed_data = await process_drawing_data(data)
-        await sio.emit('drawing_update', processed_data, room=room, skip_sid=sid)
+        # Tag the sender and broadcast to the whole room: skip_sid makes
+        # python-socketio filter every sid in Python on each draw tick,
+        # so clients drop their own echo via the origin tag instead
+        processed_data['origin'] = sid
+        await sio.emit('drawing_update', processed_data, room=room)
 
 @sio.event
 async def clear_canvas(sid, data):
@@ -93,4 +131,15 @@ async def process_drawing_data(data):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(socket_app, host="0.0.0.0", port=8000, reload=False) 
\ No newline at end of file
+    # uvloop + httptools roughly double JSON/Socket.IO throughput over the
+    # default asyncio loop and h11 parser; the import string is required
+    # for multi-worker runs
+    uvicorn.run(
+        "main:socket_app",
+        host="0.0.0.0",
+        port=8000,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=settings.WORKERS
+    ) 
\ No newline at end of file
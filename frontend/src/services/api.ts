@@ -90,6 +90,42 @@ class ApiService {
     });
   }
 
+  // Binary variants: send the canvas blob directly instead of a base64
+  // data URI (~25% fewer bytes, no decode step on the server)
+  async detectShapesFromBlob(blob: Blob, confidenceThreshold: number = 0.7): Promise<ShapeDetectionResult> {
+    return this.uploadBlob<ShapeDetectionResult>(
+      `/ai/detect-shapes-binary?confidence_threshold=${confidenceThreshold}`,
+      blob
+    );
+  }
+
+  async performOCRFromBlob(blob: Blob, language: string = 'eng'): Promise<OCRResult> {
+    return this.uploadBlob<OCRResult>(`/ai/ocr-binary?language=${language}`, blob);
+  }
+
+  private async uploadBlob<T>(endpoint: string, blob: Blob): Promise<T> {
+    const formData = new FormData();
+    formData.append('file', blob, 'canvas.png');
+
+    const url = `${this.baseUrl}${endpoint}`;
+
+    try {
+      const response = await fetch(url, {
+        method: 'POST',
+        body: formData,
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('API request failed:', error);
+      throw error;
+    }
+  }
+
   async analyzeCanvas(roomId: string): Promise<CanvasAnalytics> {
     return this.request<CanvasAnalytics>(`/ai/analyze?room_id=${roomId}`, {
       method: 'POST',
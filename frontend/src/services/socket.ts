@@ -55,6 +55,11 @@ class SocketService {
     });
 
     this.socket.on('drawing_update', (data) => {
+      // The server broadcasts to the whole room; drop our own echo since
+      // the stroke was already rendered locally
+      if (data.origin && data.origin === this.socket?.id) {
+        return;
+      }
       console.log('Received drawing update:', data);
       this.eventHandlers.onDrawingUpdate?.(data);
     });
@@ -94,6 +94,7 @@ export interface SocketDrawingData {
   stroke?: DrawingStroke;
   room: string;
   userId?: string;
+  origin?: string; // sid of the sender, set by the server on broadcast
 }
 
 export interface SocketClearData {